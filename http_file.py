@@ -1,14 +1,40 @@
+import queue
+import threading
+
 import requests
+from requests.adapters import HTTPAdapter
+from requests_toolbelt.multipart.encoder import MultipartEncoder
 from concurrent.futures import ThreadPoolExecutor
 from loguru import logger
 from pathlib import Path
 
-def upload_file(file_path, url):
+# 连接池大小，需不小于并发上传的线程数
+POOL_SIZE = 16
+UPLOAD_TIMEOUT = 60
+
+def create_session(pool_size=POOL_SIZE):
+    """
+    创建带连接池的 Session，复用 HTTP keep-alive 连接，避免每次上传都重新建立 TCP/TLS 连接。
+    Args:
+        pool_size (int): 连接池大小。
+    Returns:
+        requests.Session: 配置好的 Session。
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+_SESSION = create_session()
+
+def upload_file(file_path, url, session=None):
     """
     上传单个文件到指定的 URL。
     Args:
         file_path (str): 要上传的文件路径。
         url (str): 目标 URL。
+        session (requests.Session): 使用的 Session，默认为模块共享的 Session。
     Returns:
         str: 上传成功后返回的 URL。
     """
@@ -17,12 +43,14 @@ def upload_file(file_path, url):
         if not file_path.exists():
             logger.error(f"文件 {file_path} 不存在")
             return None
-        logger.info(f"上传文件 {file_path} 到 {url}")
+        logger.debug("上传文件 {} 到 {}", file_path, url)
         with open(file_path, 'rb') as file:
-            files = {'file': file}
-            response = requests.post(url, files=files)
+            # 使用 MultipartEncoder 从磁盘流式发送文件，避免在内存中拼接整个请求体
+            m = MultipartEncoder(fields={'file': (file_path.name, file, 'application/octet-stream')})
+            response = (session or _SESSION).post(url, data=m, headers={'Content-Type': m.content_type},
+                                                  timeout=UPLOAD_TIMEOUT)
             response.raise_for_status()
-            logger.info(f"文件 {file_path} 上传成功，响应状态码: {response.status_code}")
+            logger.debug("文件 {} 上传成功，响应状态码: {}", file_path, response.status_code)
             return url + '/' + file_path.name
     except requests.RequestException as e:
         logger.error(f"文件 {file_path} 上传失败: {e}")
@@ -30,6 +58,31 @@ def upload_file(file_path, url):
         logger.error(f"处理文件 {file_path} 时发生未知错误: {e}")
     return None
 
+def upload_bytes(name, data, url, session=None):
+    """
+    上传内存中的文件内容到指定的 URL，无需先写入磁盘。
+    Args:
+        name (str): 上传后的文件名。
+        data (bytes): 文件内容。
+        url (str): 目标 URL。
+        session (requests.Session): 使用的 Session，默认为模块共享的 Session。
+    Returns:
+        str: 上传成功后返回的 URL。
+    """
+    try:
+        logger.debug("上传文件 {}（{} 字节）到 {}", name, len(data), url)
+        m = MultipartEncoder(fields={'file': (name, data, 'application/octet-stream')})
+        response = (session or _SESSION).post(url, data=m, headers={'Content-Type': m.content_type},
+                                              timeout=UPLOAD_TIMEOUT)
+        response.raise_for_status()
+        logger.debug("文件 {} 上传成功，响应状态码: {}", name, response.status_code)
+        return url + '/' + name
+    except requests.RequestException as e:
+        logger.error(f"文件 {name} 上传失败: {e}")
+    except Exception as e:
+        logger.error(f"处理文件 {name} 时发生未知错误: {e}")
+    return None
+
 def concurrent_upload(file_list, url, max_workers=5):
     """
     并发上传文件列表到指定的 URL。
@@ -41,12 +94,56 @@ def concurrent_upload(file_list, url, max_workers=5):
         list: 成功上传的文件的 URL 列表。
     """
     urls = []
+    # 连接池不足时按并发数新建 Session，保证每个线程都能复用连接
+    session = _SESSION if max_workers <= POOL_SIZE else create_session(max_workers)
     with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        futures = [executor.submit(upload_file, file, url) for file in file_list]
+        futures = [executor.submit(upload_file, file, url, session) for file in file_list]
         for future in futures:
             result = future.result()
             if result:
                 urls.append(result)
+    logger.info(f"上传完成：{len(urls)}/{len(futures)} 个文件上传成功")
+    return urls
+
+_END = object()
+
+def pipelined_upload(file_iter, url, max_workers=5, queue_size=8):
+    """
+    边生成边上传：file_iter 逐个产出文件路径或 (文件名, 文件内容) 元组（例如逐页渲染得到的图片），
+    上传线程从有界队列中取出并上传，使生成与上传重叠进行，总耗时接近两者中较慢的一个。
+    Args:
+        file_iter (iterable): 产出文件路径或 (文件名, bytes) 元组的可迭代对象。
+        url (str): 目标 URL。
+        max_workers (int): 上传线程数。
+        queue_size (int): 队列容量，生成速度超过上传速度时在此阻塞。
+    Returns:
+        list: 成功上传的文件的 URL 列表，顺序与 file_iter 一致。
+    """
+    tasks = queue.Queue(maxsize=queue_size)
+    results = {}
+    session = _SESSION if max_workers <= POOL_SIZE else create_session(max_workers)
+
+    def worker():
+        while (task := tasks.get()) is not _END:
+            index, file = task
+            if isinstance(file, tuple):
+                results[index] = upload_bytes(*file, url, session)
+            else:
+                results[index] = upload_file(file, url, session)
+
+    workers = [threading.Thread(target=worker, daemon=True) for _ in range(max_workers)]
+    for t in workers:
+        t.start()
+    try:
+        for index, file in enumerate(file_iter):
+            tasks.put((index, file))
+    finally:
+        for _ in workers:
+            tasks.put(_END)
+        for t in workers:
+            t.join()
+    urls = [results[index] for index in sorted(results) if results[index]]
+    logger.info(f"上传完成：{len(urls)}/{len(results)} 个文件上传成功")
     return urls
 
 if __name__ == "__main__":
@@ -1,28 +1,77 @@
 import configparser
+import json
+import os
 import re
+import sys
 import hashlib
-import shutil
+import operator
+from collections import deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from dataclasses import dataclass, field
+from functools import partial
+from itertools import islice
 from pathlib import Path
-from typing import Any, List, Union
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Union
 
-from PIL import Image
-import fitz 
 from loguru import logger
 
-from http_file import concurrent_upload, upload_file
+from http_file import pipelined_upload
+from render import IMAGE_FORMATS, close_document, open_document, page_output_path, render_page
 
 from mcp.server.fastmcp import FastMCP
 
 # Initialize FastMCP server
 mcp = FastMCP("pdf2pics")
 
+CONFIG_PATH = Path('config.ini')
+CONFIG_CACHE_PATH = Path('.config.cache.json')
+
+def load_config(config_path: Path = CONFIG_PATH, cache_path: Path = CONFIG_CACHE_PATH) -> configparser.ConfigParser:
+    """
+    读取系统配置。解析结果以 config.ini 的 mtime 为键缓存到 cache_path，
+    配置文件未修改时直接读取缓存，适用于 MCP stdio 模式下每次请求都冷启动的场景。
+    """
+    config = configparser.ConfigParser()
+    mtime = config_path.stat().st_mtime if config_path.exists() else None
+    try:
+        cached = json.loads(cache_path.read_text(encoding='utf-8'))
+        if cached['mtime'] == mtime:
+            config.read_dict(cached['sections'])
+            return config
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    config.read(config_path, encoding='utf-8')
+    sections = {section: dict(config.items(section, raw=True)) for section in config.sections()}
+    try:
+        cache_path.write_text(json.dumps({'mtime': mtime, 'sections': sections}, ensure_ascii=False),
+                              encoding='utf-8')
+    except OSError as e:
+        logger.warning(f"写入配置缓存失败：{e}")
+    return config
+
 # 读取系统配置
-config = configparser.ConfigParser()
-config.read('config.ini')
+config = load_config()
 PDF_ROOT = Path(config.get('PATHS', 'pdf_root', fallback='.'))
 OUTPUT_ROOT = Path(config.get('PATHS', 'output_root', fallback='output'))
 HTTP_FILE_SERVER_URL = config.get('HTTP_FILE_SERVER', 'endpoint', fallback='http://127.0.0.1')
 HTTP_FILE_UPLOAD_CONCURRENCY = int(config.get('HTTP_FILE_SERVER', 'concurrency', fallback='5'))
+# 渲染缩放因子：像素数与 zoom 的平方成正比（zoom=4 的像素数是 zoom=2 的4倍），渲染和编码耗时也随之增长。
+# 设置 dpi 时以 dpi 为准（PDF 的基准分辨率为 72 DPI，zoom = dpi / 72）
+RENDER_DPI = int(config.get('RENDER', 'dpi', fallback='0'))
+ZOOM = RENDER_DPI / 72 if RENDER_DPI > 0 else float(config.get('RENDER', 'zoom', fallback='2'))
+# 输出图片格式：png（适合图表、文字）、jpeg/webp（适合扫描件、照片，编码更快、文件更小）
+IMAGE_FORMAT = config.get('RENDER', 'format', fallback='png').lower()
+IMAGE_QUALITY = int(config.get('RENDER', 'quality', fallback='85'))
+# 渲染色彩空间：rgb、gray，或 auto（按页渲染低分辨率探测图检测，单色页面以灰度渲染，像素数据只有 RGB 的1/3）
+COLOR_MODES = ('auto', 'rgb', 'gray')
+COLOR_MODE = config.get('RENDER', 'color', fallback='auto').lower()
+# 渲染进程数
+RENDER_WORKERS = os.cpu_count() or 1
+# 日志级别，默认 INFO；DEBUG 级别的逐文件日志在 INFO 级别下不会被格式化
+LOG_LEVEL = config.get('LOG', 'level', fallback='INFO').upper()
+
+# 上传时将相对路径中的目录分隔符替换为下划线
+_FLATTEN_RE = re.compile(r'[\\/]+')
 
 # 添加配置验证逻辑
 def validate_config():
@@ -30,55 +79,297 @@ def validate_config():
         raise FileNotFoundError(f"PDF根目录不存在：{PDF_ROOT}")
     if not OUTPUT_ROOT.exists():
         OUTPUT_ROOT.mkdir(parents=True, exist_ok=True)
+    if IMAGE_FORMAT not in IMAGE_FORMATS:
+        raise ValueError(f"不支持的图片格式：{IMAGE_FORMAT}，可选值：{', '.join(IMAGE_FORMATS)}")
+    if COLOR_MODE not in COLOR_MODES:
+        raise ValueError(f"不支持的色彩模式：{COLOR_MODE}，可选值：{', '.join(COLOR_MODES)}")
 
 # 在程序初始化时调用
 validate_config()
 
 # 新增loguru配置（添加到配置验证之后）
+logger.remove()
+logger.add(sys.stderr, level=LOG_LEVEL)
 logger.add(
     OUTPUT_ROOT / 'conversion.log',
+    level=LOG_LEVEL,
     format="{time:YYYY-MM-DD HH:mm:ss} | {level} | {message}",
     rotation="10 MB",
-    encoding='utf-8'
+    encoding='utf-8',
+    # 经由队列写入，多个进程或线程同时记录日志、日志轮转时也不会互相覆盖
+    enqueue=True,
 )
 
-def convert_pdf_to_images(pdf: Union[str, Path], output_dir: Union[str, Path], return_pic_url: bool = True) -> List[str]:
-    """
-    将单个 PDF 文件转换为与该 PDF 文件同名的图片，并将这些图片保存到指定目录。
-    """
-    doc = fitz.open(pdf)
-    output_dir = Path(output_dir)
-    output_dir.mkdir(parents=True, exist_ok=True)
-    logger.info(f"Converting {pdf} to {output_dir}")
-    image_paths = []
-    
-    # 提升分辨率参数（原2倍提升改为4倍）
-    zoom = 4  # 矩阵缩放因子从2改为4
-    mat = fitz.Matrix(zoom, zoom)
-    
-    for page_num in range(len(doc)):
-        page = doc[page_num]
-        pix = page.get_pixmap(matrix=mat)  # 使用更高清参数
-        output_path = output_dir / f"{pdf.stem}-{page_num+1}.png"
-        img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-        img.save(output_path, format="PNG")
-        image_paths.append(str(output_path.relative_to(OUTPUT_ROOT)))
-
-    doc.close()
+def file_sha1(path: Path) -> str:
+    """
+    分块计算文件的 SHA1，避免一次性读入大文件。
+    """
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def _read_manifest(manifest_path: Path) -> dict[str, Any]:
+    try:
+        return json.loads(manifest_path.read_text(encoding='utf-8'))
+    except (OSError, ValueError):
+        return {}
+
+def submit_bounded(executor: Optional[Executor], fn: Callable, items: Iterable,
+                   max_in_flight: int) -> Iterator[Future]:
+    """
+    按 items 的顺序逐个提交任务并产出对应的 Future，同一时刻最多有 max_in_flight 个任务未被取走：
+    调用方每取走一个 Future，才提交下一个任务。消费方（例如上传队列）阻塞时渲染随之暂停，
+    已渲染但尚未上传的图片数量有界。executor 为 None 时在当前线程中依次执行。
+    """
+    items = iter(items)
+
+    def submit(item) -> Future:
+        if executor is not None:
+            return executor.submit(fn, item)
+        future = Future()
+        try:
+            future.set_result(fn(item))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    if executor is None:
+        # 当前线程中执行时提前提交没有意义，取一个执行一个
+        max_in_flight = 1
+    in_flight = deque(submit(item) for item in islice(items, max_in_flight))
+    try:
+        while in_flight:
+            yield in_flight.popleft()
+            in_flight.extend(submit(item) for item in islice(items, 1))
+    finally:
+        for future in in_flight:
+            future.cancel()
+
+@dataclass
+class _PdfJob:
+    """
+    单个 PDF 的转换计划与结果。
+    """
+    pdf: Path
+    output_dir: Path
+    stem: str
+    render_options: dict[str, Any]
+    page_count: int
+    page_nums: List[int]
+    pending: List[int]
+    rendered: set[int]
+    images: List[str] = field(default_factory=list)
+    error: Optional[Exception] = None
+
+    @property
+    def manifest_path(self) -> Path:
+        return self.output_dir / f".{self.stem}.manifest.json"
+
+def _plan_pdf(pdf: Path, output_dir: Path, *, zoom: float, image_format: str, quality: int, color_mode: str,
+              pages: Optional[List[int]], flatten_names: bool) -> _PdfJob:
+    """
+    根据 manifest 确定 PDF 需要产出的页面，以及其中需要重新渲染的页面。
+    """
+    # `.文件名.manifest.json`记录渲染选项、页数和已渲染的页面，任一选项变化时全部重新渲染；
+    # 已渲染且比 PDF 新的图片不会重复渲染
+    stem = pdf.stem
+    if flatten_names:
+        stem = flatten_name(str((output_dir / stem).relative_to(OUTPUT_ROOT)))
+        output_dir = OUTPUT_ROOT
+
+    pdf_mtime = pdf.stat().st_mtime
+    manifest = _read_manifest(output_dir / f".{stem}.manifest.json")
+    # PNG 为无损格式，quality 不影响输出，只对 JPEG/WebP 参与比较
+    render_options = {'pdf_sha1': file_sha1(pdf), 'zoom': zoom, 'format': image_format,
+                      'quality': quality if image_format != 'png' else None, 'color': color_mode}
+    if isinstance(manifest.get('num_pages'), int) and all(manifest.get(k) == v for k, v in render_options.items()):
+        page_count = manifest['num_pages']
+        rendered = set(manifest.get('rendered', ()))
+    else:
+        page_count = len(open_document(pdf))
+        rendered = set()
+
+    if pages is None:
+        page_nums = list(range(page_count))
+    else:
+        invalid = [p for p in pages if not 1 <= p <= page_count]
+        if invalid:
+            raise ValueError(f"页码超出范围（共{page_count}页）：{invalid}")
+        page_nums = sorted({p - 1 for p in pages})
+
+    def is_fresh(page_num: int) -> bool:
+        path = page_output_path(output_dir, stem, page_num, image_format)
+        return page_num in rendered and path.exists() and path.stat().st_mtime >= pdf_mtime
+
+    pending = [page_num for page_num in page_nums if not is_fresh(page_num)]
+    if pending:
+        logger.debug("Converting {} to {} ({}/{} pages)", pdf, output_dir, len(pending), len(page_nums))
+    else:
+        logger.debug("Skipping {}: all {} pages are up to date in {}", pdf, len(page_nums), output_dir)
+    return _PdfJob(pdf, output_dir, stem, render_options, page_count, page_nums, pending, rendered)
 
+def _render_jobs(jobs: List[_PdfJob], *, zoom: float, image_format: str, quality: int, color_mode: str,
+                 in_memory: bool, executor: Optional[Executor]) -> Iterator[Union[str, tuple[str, bytes]]]:
+    """
+    按 PDF、页码顺序产出 jobs 的所有图片，产出的图片名记录在 job.images 中。
+    某页渲染失败时记录到该 PDF 的 error，不再产出它的图片，其余 PDF 不受影响。
+    """
+    # 所有 PDF 的待渲染页面进入同一个有界任务流，前一个 PDF 的最后几页与后一个 PDF 的页面同时渲染；
+    # 任务在进程中执行（PyMuPDF 渲染时不释放 GIL），render_page 来自可按模块名导入的 render 模块
+    tasks = (
+        partial(render_page, str(job.pdf), page_num, zoom=zoom, output_dir=job.output_dir, stem=job.stem,
+                image_format=image_format, quality=quality, color_mode=color_mode, in_memory=in_memory)
+        for job in jobs for page_num in job.pending
+    )
+    total_pending = sum(len(job.pending) for job in jobs)
+    own_executor = None
+    if total_pending > 1 and executor is None:
+        executor = own_executor = ProcessPoolExecutor(max_workers=min(total_pending, RENDER_WORKERS))
+    try:
+        # 只有一页需要渲染时直接在当前进程中渲染，避免启动子进程；
+        # 每个渲染进程最多预先排队一页，其余页面等前面的结果被取走后再提交
+        rendered_iter = submit_bounded(executor if total_pending > 1 else None, operator.call, tasks,
+                                       max_in_flight=2 * RENDER_WORKERS)
+        for job in jobs:
+            pending = set(job.pending)
+            for page_num in job.page_nums:
+                if page_num in pending:
+                    # 失败的 PDF 的其余页面也要取走，后续 PDF 的结果才能与页面对应
+                    try:
+                        image = next(rendered_iter).result()
+                    except Exception as e:
+                        if job.error is None:
+                            job.error = e
+                            logger.error(f"Conversion of {job.pdf} failed: {e}")
+                        continue
+                    job.rendered.add(page_num)
+                else:
+                    image = str(page_output_path(job.output_dir, job.stem, page_num, image_format))
+                if job.error is None:
+                    job.images.append(image[0] if in_memory else str(Path(image).relative_to(OUTPUT_ROOT)))
+                    yield image
+            # 在内存中编码时磁盘上没有新文件，不更新 manifest
+            if job.pending and not in_memory:
+                manifest = {**job.render_options, 'num_pages': job.page_count,
+                            'rendered': sorted(job.rendered)}
+                job.manifest_path.write_text(json.dumps(manifest), encoding='utf-8')
+    finally:
+        if own_executor is not None:
+            own_executor.shutdown(cancel_futures=True)
+        close_document()
+
+def convert_pdf_to_images(
+    pdf: Union[str, Path],
+    output_dir: Union[str, Path],
+    return_pic_url: bool = True,
+    *,
+    zoom: float = ZOOM,
+    image_format: str = IMAGE_FORMAT,
+    quality: int = IMAGE_QUALITY,
+    color_mode: str = COLOR_MODE,
+    pages: Optional[List[int]] = None,
+    flatten_names: bool = False,
+    upload_url: str = HTTP_FILE_SERVER_URL,
+    executor: Optional[Executor] = None,
+) -> List[str]:
+    """
+    将单个 PDF 文件转换为与该 PDF 文件同名的图片，保存到 output_dir（须已存在）或上传到 upload_url，
+    返回图片相对 OUTPUT_ROOT 的路径或 URL。pages 为要转换的页码（从1开始），默认为全部页面；
+    flatten_names 为 True 时图片以`相对路径_文件名-页码.扩展名`命名并写入 OUTPUT_ROOT，上传的图片也按此命名。
+    """
+    options = dict(zoom=zoom, image_format=image_format, quality=quality, color_mode=color_mode)
+    flatten_names = flatten_names or return_pic_url
+    job = _plan_pdf(Path(pdf), Path(output_dir), pages=pages, flatten_names=flatten_names, **options)
+    # 需要上传时页面在内存中编码后直接上传，不写入磁盘
+    images = _render_jobs([job], in_memory=return_pic_url, executor=executor, **options)
+    if return_pic_url:
+        # 渲染与上传流水线并行
+        urls = upload_images(images, upload_url)
+    else:
+        for _ in images:
+            pass
+    if job.error is not None:
+        raise job.error
+    return urls if return_pic_url else job.images
+
+def flatten_name(image: str) -> str:
+    """
+    将相对路径展平为上传后的文件名，例如`a/b/c-1.png`转为`a_b_c-1.png`。
+    """
+    return _FLATTEN_RE.sub('_', image)
+
+def iter_pdfs(root: Union[str, Path]) -> Iterator[Path]:
+    """
+    递归遍历 root 下（包括子文件夹）的所有 PDF 文件（扩展名不区分大小写）。
+    os.scandir 返回的条目自带文件类型信息，无需对每个条目额外调用 stat。
+    """
+    with os.scandir(root) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                yield from iter_pdfs(entry.path)
+            elif entry.name.lower().endswith('.pdf') and entry.is_file():
+                yield Path(entry.path)
+
+def convert_pdfs_to_images(
+    pdf_list: List[Path],
+    return_pic_url: bool = True,
+    *,
+    zoom: float = ZOOM,
+    image_format: str = IMAGE_FORMAT,
+    quality: int = IMAGE_QUALITY,
+    color_mode: str = COLOR_MODE,
+    upload_url: str = HTTP_FILE_SERVER_URL,
+    executor: Optional[Executor] = None,
+) -> dict[str, List[str]]:
+    """
+    批量转换 PDF_ROOT 下的多个 PDF 文件，返回以相对 PDF_ROOT 的路径为键的图片路径或 URL 列表。
+    单个 PDF 转换失败只记录错误，不影响其余 PDF；未上传成功的图片不出现在结果中。
+    """
+    options = dict(zoom=zoom, image_format=image_format, quality=quality, color_mode=color_mode)
+    jobs = []
+    output_subdirs = set()
+    for pdf in pdf_list:
+        output_subdir = OUTPUT_ROOT / pdf.relative_to(PDF_ROOT).parent
+        if not return_pic_url and output_subdir not in output_subdirs:
+            output_subdir.mkdir(parents=True, exist_ok=True)
+            output_subdirs.add(output_subdir)
+        # 单个 PDF 转换失败只记录错误，不影响其余 PDF
+        try:
+            jobs.append(_plan_pdf(pdf, output_subdir, pages=None, flatten_names=return_pic_url, **options))
+        except Exception as e:
+            logger.error(f"Conversion of {pdf} failed: {e}")
+
+    uploaded = set()
+    images = _render_jobs(jobs, in_memory=False, executor=executor, **options)
+    try:
+        if return_pic_url:
+            uploaded.update(upload_images(images, upload_url))
+        else:
+            for _ in images:
+                pass
+    except Exception as e:
+        # 改为loguru方式（自动包含上下文信息）
+        logger.error(f"Conversion failed: {e}")
+    result = {str(job.pdf.relative_to(PDF_ROOT)): job.images for job in jobs if job.error is None}
+    # 每批只输出一条 INFO 汇总，单个 PDF 的进度见 DEBUG 日志
+    logger.info("Converted {}/{} PDF files ({} images)",
+                len(result), len(pdf_list), sum(map(len, result.values())))
     if return_pic_url:
-        # 上传图片到HTTP文件服务器
-        upload_paths = []
-        for image in image_paths:
-            original_file = OUTPUT_ROOT / image
-            upload_file = OUTPUT_ROOT / re.sub(r'[\\/]', '_', image)
-            logger.info(f"Preparing {original_file} to {upload_file}")
-            shutil.move(original_file, upload_file)
-            upload_paths.append(str(upload_file))
-        logger.info(f"Uploading {upload_paths} images to {HTTP_FILE_SERVER_URL}")
-        image_paths = concurrent_upload(upload_paths, HTTP_FILE_SERVER_URL, max_workers = HTTP_FILE_UPLOAD_CONCURRENCY)
-    return image_paths
+        # 无论是否出错都将本地文件名映射为已上传的 URL，未上传成功的图片不返回
+        result = {
+            pdf: [url for url in (f"{upload_url}/{image}" for image in images) if url in uploaded]
+            for pdf, images in result.items()
+        }
+    return result
 
+def upload_images(image_files: Iterable[Union[str, tuple[str, bytes]]], upload_url: str) -> List[str]:
+    """
+    边渲染边上传图片到 upload_url，返回成功上传的图片 URL，单个和批量转换共用。
+    """
+    logger.debug("Uploading images to {}", upload_url)
+    return pipelined_upload(image_files, upload_url, max_workers=HTTP_FILE_UPLOAD_CONCURRENCY)
 
 @mcp.tool()
 def convert_pdfs(pdfs_dir: str, return_pic_url: bool = True) -> dict[str, Any]:
@@ -88,40 +379,31 @@ def convert_pdfs(pdfs_dir: str, return_pic_url: bool = True) -> dict[str, Any]:
         pdfs_dir str: PDF 文件夹路径，不包含子文件下的文件
         return_pic_url bool: 是否上传图片到http 文件服务器，并返回图片的URL。默认为True。
     返回:
-        dict: 包含输出目录相对路径的字典。其中上传后，文件名会转为`相对路径_文件名-页码.png`的格式。例如，路径为`a/b/c.pdf`，则会生成`/a_b_c-1.png`、`/a_b_c-2.png`等文件。
+        dict: 包含输出目录相对路径的字典。其中上传后，文件名会转为`相对路径_文件名-页码.扩展名`的格式（扩展名由`[RENDER] format`决定）。
+              例如，路径为`a/b/c.pdf`，则会生成`/a_b_c-1.png`、`/a_b_c-2.png`等文件。
     """
-    result = {}
     pdfs = PDF_ROOT / pdfs_dir
     if pdfs.is_dir():
         # 扫描目录下的PDF文件
-        pdf_list = list(pdfs.glob('**/*.pdf'))
-        logger.info(f"Found {len(pdf_list)} PDF files in {pdfs.absolute()}: {pdf_list}")
+        pdf_list = list(iter_pdfs(pdfs))
+        logger.info("Found {} PDF files in {}", len(pdf_list), pdfs.absolute())
+        logger.debug("PDF files: {}", pdf_list)
     else:
         raise ValueError("输入路径不是有效的目录")
-    
-    # 添加异常处理
-    try:
-        for pdf in pdf_list:
-            pdf_path = pdf
-            output_subdir = OUTPUT_ROOT / pdf.relative_to(PDF_ROOT).parent
-            logger.info(f"Converting {pdf}(path:{pdf_path}) to {output_subdir}")
-            result[str(pdf.relative_to(PDF_ROOT))] = convert_pdf_to_images(pdf_path, output_subdir, return_pic_url)
-    except Exception as e:
-        # 改为loguru方式（自动包含上下文信息）
-        logger.error(f"Conversion failed: {e}")
-    return result
+    return convert_pdfs_to_images(pdf_list, return_pic_url)
 
 @mcp.tool()
-def convert_pdf(pdf_name: str, return_pic_url: bool = True) -> dict[str, Any]:
+def convert_pdf(pdf_name: str, return_pic_url: bool = True, pages: Optional[List[int]] = None) -> dict[str, Any]:
     """
     将单个 PDF 文件转换为与该 PDF 同名的图片，并将这些图片保存到指定目录。
     参数:
         pdf_name (str): 要转换的 PDF 文件的名称。
         return_pic_url (bool): 是否上传图片到http 文件服务器，并返回图片的URL。默认为True。
+        pages (list[int]): 要转换的页码（从1开始），默认转换全部页面。
     返回:
         dict[str, Any]: 包含输出目录相对路径的字典。
     """
-    return {pdf_name: convert_pdf_to_images(PDF_ROOT / pdf_name, OUTPUT_ROOT, return_pic_url)}
+    return {pdf_name: convert_pdf_to_images(PDF_ROOT / pdf_name, OUTPUT_ROOT, return_pic_url, pages=pages)}
 
 def format_output(data: Union[str, dict[str, Any]]) -> str:
     """
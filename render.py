@@ -0,0 +1,120 @@
+"""
+PDF 页面渲染与图片编码。
+本模块只依赖 PyMuPDF，不读取配置、不初始化日志和 MCP 服务，供渲染子进程按模块名导入：
+`mcp run` / `mcp dev` 以未注册的模块名加载 pdf2pics.py，其中定义的函数无法 pickle 到子进程。
+PyMuPDF 以单线程模式初始化 MuPDF，渲染时不会释放 GIL，因此页面级并行只能使用多进程。
+"""
+import os
+from pathlib import Path
+from typing import Optional, Union
+
+import fitz
+
+# 可选的 SIMD PNG 编码器（未发布到 PyPI，需要从源码构建安装），未安装时回退到 PyMuPDF 自带的编码器
+try:
+    import fpnge
+except ImportError:
+    fpnge = None
+
+# 支持的图片格式及其扩展名
+IMAGE_FORMATS = {'png': 'png', 'jpeg': 'jpg', 'webp': 'webp'}
+
+def save_image(pix: fitz.Pixmap, output_path: Path, image_format: str, quality: int) -> None:
+    """
+    将 pixmap 按 image_format 编码并写入 output_path。
+    PNG 优先使用 fpnge，否则与 JPEG 一样使用 PyMuPDF 自带的编码器，直接读取 pixmap 的像素缓冲区，不经过 PIL 复制；
+    WebP 由 PyMuPDF 借助 PIL 编码，使用最快的 method=0。
+    """
+    if image_format == 'jpeg':
+        pix.save(str(output_path), jpg_quality=quality)
+    elif image_format == 'webp':
+        pix.pil_save(str(output_path), format='WEBP', quality=quality, method=0)
+    elif fpnge is not None:
+        png_bytes = fpnge.fromview(pix.samples_mv, pix.width, pix.height, pix.n, 8, pix.stride)
+        output_path.write_bytes(png_bytes)
+    else:
+        pix.save(str(output_path))
+
+def encode_image(pix: fitz.Pixmap, image_format: str, quality: int) -> bytes:
+    """
+    将 pixmap 按 image_format 编码为内存中的图片数据，编码方式与 save_image 相同。
+    """
+    if image_format == 'jpeg':
+        return pix.tobytes('jpg', jpg_quality=quality)
+    if image_format == 'webp':
+        return pix.pil_tobytes(format='WEBP', quality=quality, method=0)
+    if fpnge is not None:
+        return fpnge.fromview(pix.samples_mv, pix.width, pix.height, pix.n, 8, pix.stride)
+    return pix.tobytes('png')
+
+def page_output_path(output_dir: Path, stem: str, page_num: int, image_format: str) -> Path:
+    """
+    返回第 page_num 页（从0开始）对应的图片路径，扩展名与图片格式一致。
+    """
+    return output_dir / f"{stem}-{page_num+1}.{IMAGE_FORMATS[image_format]}"
+
+# auto 模式下用于判断页面是否为单色的探测图缩放因子，A4 页面约 300x420 像素，渲染约 1ms
+PROBE_ZOOM = 0.5
+
+def is_grayscale_pixmap(pix: fitz.Pixmap) -> bool:
+    """
+    判断 RGB pixmap 的每个像素是否都满足 R == G == B，通过 samples_mv 比较，不复制像素缓冲区。
+    """
+    samples = pix.samples_mv
+    return samples[0::3] == samples[1::3] == samples[2::3]
+
+def is_grayscale_page(page: fitz.Page, zoom: float) -> bool:
+    """
+    以低分辨率渲染页面的 RGB 探测图并逐像素判断是否为单色。
+    检查的是渲染结果，文字、矢量图形、图片、渐变和图案填充都会被覆盖，不会把彩色页面误判为单色。
+    """
+    probe_zoom = min(zoom, PROBE_ZOOM)
+    probe = page.get_pixmap(matrix=fitz.Matrix(probe_zoom, probe_zoom), colorspace=fitz.csRGB)
+    return is_grayscale_pixmap(probe)
+
+# 当前进程最近打开的 Document：(进程号, 路径, mtime, Document)。
+# 同一进程连续渲染同一 PDF 的多页时复用，不必每页重新解析 PDF。
+# 以 fork 方式启动的渲染进程会继承父进程已打开的 Document，它们共用同一个文件偏移量，
+# 并发读取会读到错误的数据，因此缓存键包含进程号，子进程总是重新打开。
+# 缓存不是线程安全的，同一进程内不能在多个线程中同时渲染
+_cached_doc: Optional[tuple[int, str, int, fitz.Document]] = None
+
+def open_document(pdf_path: Union[str, Path]) -> fitz.Document:
+    """
+    打开 PDF，同一文件未修改时返回当前进程中已打开的 Document。
+    """
+    global _cached_doc
+    pdf_path = str(pdf_path)
+    key = (os.getpid(), pdf_path, os.stat(pdf_path).st_mtime_ns)
+    if _cached_doc is not None and _cached_doc[:3] == key:
+        return _cached_doc[3]
+    close_document()
+    doc = fitz.open(pdf_path)
+    _cached_doc = (*key, doc)
+    return doc
+
+def close_document() -> None:
+    """
+    关闭当前进程中缓存的 Document。
+    """
+    global _cached_doc
+    if _cached_doc is not None:
+        _cached_doc[3].close()
+        _cached_doc = None
+
+def render_page(pdf_path: str, page_num: int, zoom: float, output_dir: Path, stem: str,
+                image_format: str, quality: int, color_mode: str, in_memory: bool) -> Union[str, tuple[str, bytes]]:
+    """
+    渲染 PDF 的第 page_num 页（从0开始）。可在渲染子进程中执行，参数均可 pickle。
+    in_memory 为 True 时编码到内存，返回 (文件名, 图片数据)，不写入磁盘；否则保存到 output_dir，返回图片路径。
+    """
+    page = open_document(pdf_path)[page_num]
+    # 单色页面直接以灰度渲染，像素数据只有 RGB 的1/3
+    gray = color_mode == 'gray' or (color_mode == 'auto' and is_grayscale_page(page, zoom))
+    # 使用更高清参数
+    pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), colorspace=fitz.csGRAY if gray else fitz.csRGB)
+    output_path = page_output_path(output_dir, stem, page_num, image_format)
+    if in_memory:
+        return output_path.name, encode_image(pix, image_format, quality)
+    save_image(pix, output_path, image_format, quality)
+    return str(output_path)
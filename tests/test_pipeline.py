@@ -0,0 +1,266 @@
+"""
+manifest 缓存、渲染任务流、上传流水线和配置缓存的测试。
+pdf2pics 在导入时读取当前目录下的 config.ini 并创建输出目录，因此在临时目录中导入。
+运行：python -m unittest discover tests
+"""
+import importlib
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+from unittest import mock
+
+import fitz
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+import http_file
+import render
+
+pdf2pics = None
+_old_cwd = None
+_tmp_dir = None
+
+def make_pdf(path: Path, page_count: int, color: bool = True) -> Path:
+    doc = fitz.open()
+    for i in range(page_count):
+        page = doc.new_page(width=300, height=400)
+        page.insert_text((36, 48 + 8 * i), f"page {i + 1} " * 8, fontsize=10)
+        fill = (i / page_count, 0.2, 1 - i / page_count) if color else (0.5, 0.5, 0.5)
+        page.draw_rect(fitz.Rect(36, 120, 150 + 4 * i, 300), color=(0, 0, 0), fill=fill)
+    doc.save(path)
+    doc.close()
+    return path
+
+def setUpModule():
+    global pdf2pics, _old_cwd, _tmp_dir
+    _old_cwd = os.getcwd()
+    _tmp_dir = tempfile.mkdtemp()
+    os.chdir(_tmp_dir)
+    Path('pdfs').mkdir()
+    Path('config.ini').write_text(
+        "[PATHS]\npdf_root=pdfs\noutput_root=output\n"
+        "[HTTP_FILE_SERVER]\nendpoint=http://127.0.0.1:9\n"
+        "[LOG]\nlevel=WARNING\n",
+        encoding='utf-8',
+    )
+    pdf2pics = importlib.import_module('pdf2pics')
+
+def tearDownModule():
+    os.chdir(_old_cwd)
+    shutil.rmtree(_tmp_dir, ignore_errors=True)
+
+class SubmitBoundedTest(unittest.TestCase):
+    def test_submits_lazily_and_in_order(self):
+        consumed = []
+
+        def items():
+            for i in range(10):
+                consumed.append(i)
+                yield i
+
+        with ThreadPoolExecutor(2) as executor:
+            futures = pdf2pics.submit_bounded(executor, lambda x: x * x, items(), max_in_flight=3)
+            self.assertEqual(next(futures).result(), 0)
+            self.assertEqual(len(consumed), 3)
+            # 取走的 Future 用完、再取下一个时才提交新任务
+            self.assertEqual(next(futures).result(), 1)
+            self.assertEqual(len(consumed), 4)
+            self.assertEqual([f.result() for f in futures], [i * i for i in range(2, 10)])
+
+    def test_inline_execution_wraps_exceptions(self):
+        def fn(x):
+            if x == 1:
+                raise ValueError(x)
+            return x
+
+        futures = list(pdf2pics.submit_bounded(None, fn, range(3), max_in_flight=8))
+        self.assertTrue(all(isinstance(f, Future) and f.done() for f in futures))
+        self.assertEqual(futures[0].result(), 0)
+        self.assertIsInstance(futures[1].exception(), ValueError)
+        self.assertEqual(futures[2].result(), 2)
+
+    def test_closing_cancels_pending_futures(self):
+        submitted = []
+
+        class RecordingExecutor(ThreadPoolExecutor):
+            def submit(self, fn, *args):
+                submitted.append(super().submit(fn, *args))
+                return submitted[-1]
+
+        with RecordingExecutor(1) as executor:
+            block = executor.submit(time.sleep, 0.2)  # 占住唯一的线程，后续任务保持排队
+            futures = pdf2pics.submit_bounded(executor, time.sleep, [0] * 5, max_in_flight=3)
+            next(futures)
+            futures.close()
+            block.result()
+        # 关闭时未取走的 Future 被取消，剩余的任务不再提交
+        self.assertEqual(len(submitted), 4)
+        self.assertTrue(all(f.cancelled() for f in submitted[2:]))
+
+class PipelinedUploadTest(unittest.TestCase):
+    def test_preserves_order_and_drops_failures(self):
+        def fake_upload(name, data, url, session=None):
+            time.sleep(0.01 * (5 - int(name)))  # 先提交的后完成
+            return None if name == '2' else f"{url}/{name}"
+
+        with mock.patch.object(http_file, 'upload_bytes', side_effect=fake_upload):
+            urls = http_file.pipelined_upload(((str(i), b'') for i in range(5)), 'http://host', max_workers=4,
+                                              queue_size=2)
+        self.assertEqual(urls, ['http://host/0', 'http://host/1', 'http://host/3', 'http://host/4'])
+
+class ManifestTest(unittest.TestCase):
+    # 图片的 mtime 被设为这个值；重新渲染会把 mtime 改为当前时间
+    SENTINEL = time.time() + 10 ** 6
+
+    def setUp(self):
+        self.output_dir = pdf2pics.OUTPUT_ROOT / self.id().rsplit('.', 1)[-1]
+        self.output_dir.mkdir()
+        self.pdf = make_pdf(pdf2pics.PDF_ROOT / f"{self.output_dir.name}.pdf", 3)
+
+    def tearDown(self):
+        shutil.rmtree(self.output_dir)
+        self.pdf.unlink()
+
+    def convert(self, **kwargs):
+        images = pdf2pics.convert_pdf_to_images(self.pdf, self.output_dir, False, **kwargs)
+        return [pdf2pics.OUTPUT_ROOT / image for image in images]
+
+    def mark(self, images):
+        for image in images:
+            os.utime(image, (self.SENTINEL, self.SENTINEL))
+
+    def rerendered(self, images):
+        return [i for i, image in enumerate(images) if image.stat().st_mtime != self.SENTINEL]
+
+    def test_unchanged_pages_are_skipped(self):
+        images = self.convert()
+        self.assertEqual([image.name for image in images], [f"{self.pdf.stem}-{i}.png" for i in (1, 2, 3)])
+        self.mark(images)
+        self.assertEqual(self.convert(), images)
+        self.assertEqual(self.rerendered(images), [])
+
+    def test_option_change_rerenders_all_pages(self):
+        self.mark(self.convert())
+        images = self.convert(zoom=1)
+        self.assertEqual(self.rerendered(images), [0, 1, 2])
+
+    def test_quality_only_matters_for_lossy_formats(self):
+        self.mark(self.convert(quality=50))
+        self.assertEqual(self.rerendered(self.convert(quality=90)), [])
+        jpegs = self.convert(image_format='jpeg', quality=50)
+        self.mark(jpegs)
+        self.assertEqual(self.rerendered(self.convert(image_format='jpeg', quality=90)), [0, 1, 2])
+
+    def test_pages_missing_from_manifest_are_rerendered(self):
+        images = self.convert(pages=[1, 3])
+        self.assertEqual(len(images), 2)
+        self.mark(images)
+        images = self.convert()
+        self.assertEqual(self.rerendered(images), [1])
+
+    def test_pdf_newer_than_image_is_rerendered(self):
+        images = self.convert()
+        self.mark(images)
+        os.utime(images[1], (self.SENTINEL - 10, self.SENTINEL - 10))
+        os.utime(self.pdf, (self.SENTINEL - 5, self.SENTINEL - 5))
+        self.assertEqual(self.rerendered(self.convert()), [1])
+
+    def test_invalid_pages_raise(self):
+        with self.assertRaises(ValueError):
+            self.convert(pages=[4])
+
+class RenderPoolTest(unittest.TestCase):
+    def setUp(self):
+        self.output_dir = pdf2pics.OUTPUT_ROOT / 'pool'
+        self.serial_dir = pdf2pics.OUTPUT_ROOT / 'serial'
+        self.output_dir.mkdir()
+        self.serial_dir.mkdir()
+        self.pdf = make_pdf(pdf2pics.PDF_ROOT / 'pool.pdf', 12)
+
+    def tearDown(self):
+        shutil.rmtree(self.output_dir)
+        shutil.rmtree(self.serial_dir)
+        self.pdf.unlink()
+
+    def test_cold_pool_run_matches_serial_render(self):
+        # 冷启动时父进程为读取页数打开 PDF，之后 fork 出的渲染进程不能复用它
+        with ProcessPoolExecutor(4) as executor:
+            images = pdf2pics.convert_pdf_to_images(self.pdf, self.output_dir, False, executor=executor)
+        render.close_document()
+        for page_num, image in enumerate(images):
+            expected = render.render_page(str(self.pdf), page_num, pdf2pics.ZOOM, self.serial_dir, 'pool',
+                                          pdf2pics.IMAGE_FORMAT, pdf2pics.IMAGE_QUALITY, pdf2pics.COLOR_MODE, True)
+            self.assertEqual((pdf2pics.OUTPUT_ROOT / image).read_bytes(), expected[1], image)
+        render.close_document()
+
+    def test_auto_color_keeps_color_pages(self):
+        gray_pdf = make_pdf(pdf2pics.PDF_ROOT / 'gray.pdf', 1, color=False)
+        try:
+            for pdf, channels in ((self.pdf, 3), (gray_pdf, 1)):
+                _, data = render.render_page(str(pdf), 0, 1, self.output_dir, 'x', 'png', 85, 'auto', True)
+                self.assertEqual(fitz.Pixmap(data).n, channels)
+        finally:
+            render.close_document()
+            gray_pdf.unlink()
+
+class BatchTest(unittest.TestCase):
+    def setUp(self):
+        self.pdf_dir = pdf2pics.PDF_ROOT / 'batch'
+        self.pdf_dir.mkdir()
+        self.pdfs = [make_pdf(self.pdf_dir / f"s{i}.pdf", 1 + i % 2) for i in range(5)]
+
+    def tearDown(self):
+        shutil.rmtree(self.pdf_dir)
+        shutil.rmtree(pdf2pics.OUTPUT_ROOT / 'batch', ignore_errors=True)
+
+    def test_failed_page_only_drops_its_pdf(self):
+        submitted = []
+
+        class FailingExecutor(ThreadPoolExecutor):
+            def submit(self, fn, task):
+                submitted.append(task.args)
+                if task.args[0].endswith('s2.pdf'):
+                    task = mock.Mock(side_effect=RuntimeError('boom'))
+                return super().submit(fn, task)
+
+        # render 模块的 Document 缓存在进程内共享，不能在多个线程中同时渲染
+        with FailingExecutor(1) as executor:
+            result = pdf2pics.convert_pdfs_to_images(self.pdfs, False, executor=executor)
+        # 一页的 PDF 也进入共享的任务流
+        self.assertEqual(len(submitted), sum(1 + i % 2 for i in range(5)))
+        self.assertEqual(sorted(result), ['batch/s0.pdf', 'batch/s1.pdf', 'batch/s3.pdf', 'batch/s4.pdf'])
+        self.assertEqual(result['batch/s1.pdf'], ['batch/s1-1.png', 'batch/s1-2.png'])
+        self.assertEqual(result['batch/s3.pdf'], ['batch/s3-1.png', 'batch/s3-2.png'])
+
+class ConfigCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.config_path = Path('cache_test.ini')
+        self.cache_path = Path('.cache_test.json')
+        self.config_path.write_text("[RENDER]\nzoom=3\n", encoding='utf-8')
+
+    def tearDown(self):
+        self.config_path.unlink()
+        self.cache_path.unlink(missing_ok=True)
+
+    def test_cache_is_keyed_on_mtime(self):
+        config = pdf2pics.load_config(self.config_path, self.cache_path)
+        self.assertEqual(config.get('RENDER', 'zoom'), '3')
+        self.assertTrue(self.cache_path.exists())
+        # 配置文件未修改时读取缓存
+        self.cache_path.write_text(self.cache_path.read_text(encoding='utf-8').replace('"3"', '"5"'),
+                                   encoding='utf-8')
+        self.assertEqual(pdf2pics.load_config(self.config_path, self.cache_path).get('RENDER', 'zoom'), '5')
+        # 配置文件修改后重新解析
+        self.config_path.write_text("[RENDER]\nzoom=4\n", encoding='utf-8')
+        mtime = time.time() + 10
+        os.utime(self.config_path, (mtime, mtime))
+        self.assertEqual(pdf2pics.load_config(self.config_path, self.cache_path).get('RENDER', 'zoom'), '4')
+
+if __name__ == '__main__':
+    unittest.main()